@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+import argparse
+
+
+class ArgParser(argparse.ArgumentParser):
+    """Class for validating and parsing of command line arguments."""
+    def __init__(self):
+        super().__init__()
+        self.add_argument('--amount', '-a',
+                          help='amount to convert: <number>')
+        self.add_argument('--input_currency', '-i',
+                          help='currency to convert from: <currency code or symbol>')
+        self.add_argument('--output_currency', '-o',
+                          help='currency to convert to: <currency code or symbol>')
+        self.add_argument('--converter', '-c',
+                          help='override the conversion method: <"xe" or "oer">')
+        self.add_argument('--currencies', action='store_true',
+                          help='print a list of currencies, no conversion is done')
+
+    def parse(self):
+        """Validate command line arguments and parse them for further use.
+
+        ArgParser reflects the two ways to use the application from CLI.
+
+        If the program is run with the "currencies" option, other parameters
+        are ignored and the function returns True for "list_currs" option.
+
+        If "currencies" option is not used, "amount" and "input_currency"
+        parameters become required. If any of them is missing or if "amount"
+        is not a number, the program quits with a reference to the README.
+
+        Options and required parameters are parsed and returned as a list.
+        """
+        args = self.parse_args()
+
+        # Check if the "--currencies" option is used.
+        # If so, skip parsing of other args, since they are not used.
+        list_currs = args.currencies
+        if list_currs:
+            return [None, '', list_currs]
+
+        # Validate and parse remaining CLI args.
+        params = dict()
+
+        if args.amount:
+            try:
+                params['amount'] = float(args.amount)
+            except ValueError:
+                print('Given "--amount" argument is not a valid number. '
+                      'Refer to README to see the usage.')
+                exit(1)
+        else:
+            print('Missing "--amount" argument. '
+                  'Refer to README to see the usage.')
+            exit(1)
+
+        if args.input_currency:
+            params['in_currency'] = args.input_currency.upper()
+        else:
+            print('Missing "--input_currency" argument. '
+                  'Refer to README to see the usage.')
+            exit(1)
+
+        # An empty output currency counts as missing.
+        try:
+            params['out_currency'] = args.output_currency.upper() or None
+        except AttributeError:
+            params['out_currency'] = None
+
+        try:
+            override_converter = args.converter.lower()
+        except AttributeError:
+            override_converter = ''
+
+        return [params, override_converter, list_currs]
@@ -1,15 +1,74 @@
 #!/usr/bin/python3
 
 try:
+    import os
+    import re
+    import mmap
+    import tempfile
     import time
+    import functools
     import json
+    import ijson
+    import numpy as np
     import requests
-    from bs4 import BeautifulSoup
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    from . import jsonlib
 except ModuleNotFoundError:
     print('Required modules could not be imported. '
           'Please install packages by running: "pip install -r requirements.txt"')
     exit(1)
 
+# Patterns extracting the conversion from the XE html page.
+RE_AMOUNT = re.compile(rb'class="uccResultAmount"[^>]*>([^<]+)<')
+RE_FROM_CURR = re.compile(rb'class="uccFromResultAmount"[^>]*>[^<]*?([A-Z]{3})[^<]*<')
+RE_TO_CURR = re.compile(rb'class="uccToCurrencyCode"[^>]*>([A-Z]{3})<')
+
+# Exchange rates shared by all OER converters in the process:
+# {app_id: (timestamp, rates)}
+RATES_CACHE = dict()
+
+
+@functools.lru_cache(maxsize=4)
+def read_cache(path, mtime):
+    """Read and parse a cache file.
+
+    The file is memory-mapped and parsed without copying it into
+    a bytes object first. If mapping fails, e.g. for an empty file,
+    the file is read the usual way. The parsed data is kept in
+    memory and reused until the modification time of the file changes.
+
+    Mapping is only safe because cache files are never truncated in
+    place: write_cache() replaces them with a new file, so an existing
+    mapping keeps the old file's contents. A file shrinking under the
+    mapping would kill the process with SIGBUS.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return jsonlib.loads(f.read())
+        with mapped:
+            return jsonlib.loadb(mapped)
+
+
+def write_cache(path, data):
+    """Write data to a cache file atomically.
+
+    The data is written to a temporary file in the same directory,
+    which then replaces the cache file. Readers in other threads or
+    processes see either the old or the new file, never a partial one.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
 
 class ConversionError(Exception):
     """Exception for errors during conversion."""
@@ -31,8 +90,26 @@ class ConverterCommon:
         self.verbosity = verbosity
         self.curr_exp = float(curr_exp) * 60
         self.currencies = dict()
+        self.currencies_timestamp = 0
+        self.currency_codes = frozenset()
+        self.currency_codes_tuple = tuple()
+        self.symbol_to_code = dict()
+        self.session = self.create_session()
         self.load_currencies()
 
+    def create_session(self):
+        """Create an HTTP session reusing connections across requests.
+
+        The connection pool is large enough for the concurrent XE
+        conversions, failed requests are retried twice.
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                              max_retries=Retry(total=2, backoff_factor=0.1))
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def load_currencies(self):
         """Load currencies from local cache or from remote server.
 
@@ -49,8 +126,8 @@ class ConverterCommon:
         missing = False
 
         try:
-            with open(f'{self.filepath}/cache_currencies.json', 'r') as f:
-                cache = json.load(f)
+            path = f'{self.filepath}/cache_currencies.json'
+            cache = read_cache(path, os.path.getmtime(path))
             time_diff = time.time() - cache['timestamp']
             if time_diff > self.curr_exp:
                 raise ExpiredError
@@ -61,6 +138,8 @@ class ConverterCommon:
             self.vprint('Currencies data cache is outdated.')
         else:
             self.currencies = cache['currencies']
+            self.currencies_timestamp = cache['timestamp']
+            self.index_currencies()
             self.vprint('Using currencies data from cache.')
             return
 
@@ -73,33 +152,62 @@ class ConverterCommon:
                 self.vprint('Using currencies data from cache, '
                             'despite being older than expiration time.')
                 self.currencies = cache['currencies']
+                self.currencies_timestamp = cache['timestamp']
+                self.index_currencies()
         else:
+            self.currencies_timestamp = time.time()
+            self.index_currencies()
             self.save_currencies()
             self.vprint('Saving currencies data to cache.')
 
     def get_currencies(self):
-        """Get currencies data from the remote server."""
+        """Get currencies data from the remote server.
+
+        The response is parsed while it is streamed, one currency at
+        a time, keeping only the symbol and name of each currency.
+        """
         self.vprint(f'Getting currencies data from {self.url_currs}')
         try:
-            response = requests.get(self.url_currs).json()
+            with self.session.get(self.url_currs, stream=True) as response:
+                response.raw.decode_content = True
+                currencies = {
+                    key: {'symbol': value['symbol'], 'name': value['name']}
+                    for key, value in ijson.kvitems(response.raw, '')
+                }
         except Exception:
             print('Error occurred while requesting currencies!')
             raise
 
-        for key, value in response.items():
-            self.currencies[key] = {
-                'symbol': value['symbol'],
-                'name': value['name']
-            }
+        self.currencies = currencies
+
+    def refresh(self):
+        """Reload the currencies data of a reused converter if expired."""
+        if time.time() - self.currencies_timestamp > self.curr_exp:
+            self.load_currencies()
+
+    def index_currencies(self):
+        """Build lookup structures from the currencies data.
+
+        Keep the currency codes as a frozenset for membership tests
+        and as a tuple for iteration. Map currency symbols to their
+        codes, whereas several currencies may share a symbol, in
+        which case the symbol is mapped to the first of them.
+        """
+        self.currency_codes = frozenset(self.currencies)
+        self.currency_codes_tuple = tuple(self.currencies)
+
+        symbol_to_code = dict()
+        for code, curr in self.currencies.items():
+            symbol_to_code.setdefault(curr['symbol'], code)
+        self.symbol_to_code = symbol_to_code
 
     def save_currencies(self):
         """Save currencies data to the local cache."""
-        with open(f'{self.filepath}/cache_currencies.json', 'w') as f:
-            cache = {
-                'timestamp': time.time(),
-                'currencies': self.currencies
-            }
-            f.write(json.dumps(cache))
+        cache = {
+            'timestamp': self.currencies_timestamp,
+            'currencies': self.currencies
+        }
+        write_cache(f'{self.filepath}/cache_currencies.json', jsonlib.dumpb(cache))
 
     def list_currencies(self):
         """Return a list of dictionaries of currency data."""
@@ -119,37 +227,53 @@ class ConverterCommon:
 
 class ConverterXE(ConverterCommon):
     """Class for the XE conversion method."""
+    # Exchange rates returned by XE, shared by all instances:
+    # {(from, to): (rate, timestamp)}
+    rate_cache = dict()
+
     def __init__(self, verbosity=False, curr_exp=1440):
         super().__init__(verbosity, curr_exp)
         self.name = 'XE'
         self.url_convert = 'http://www.xe.com/currencyconverter/convert/'
-        self.params = {}
+        self.rate_exp = 300
 
     def convert(self, params):
         """Execute the conversion with given parameters.
 
-        Call the get_response() method to get the conversion
-        from the remote server. If an error occurs, raise an
-        error handled by the main app.
+        If the exchange rate for the given currency pair was requested
+        recently, calculate the conversion from the cached rate.
+
+        Otherwise call the get_response() method to get the rate for
+        one unit of the input currency from the remote server. If an
+        error occurs, raise an error handled by the main app.
 
         If response is available, call the check_response()
         method to test if it is as expected. If the test passes,
-        return the converted value. Otherwise, raise a non-fatal
-        "unsupported" exception to the main app.
+        cache the rate and return the converted value. Otherwise,
+        raise a non-fatal "unsupported" exception to the main app.
+
+        The request parameters are kept local to the call, so that
+        multiple conversions can run concurrently in threads.
         """
-        self.params = {
-            'Amount': params['amount'],
+        pair = (params['in_currency'], params['out_currency'])
+        cached = self.rate_cache.get(pair)
+        if cached is not None and time.time() - cached[1] < self.rate_exp:
+            return params['amount'] * cached[0]
+
+        xe_params = {
+            'Amount': 1,
             'From': params['in_currency'],
             'To': params['out_currency']
         }
 
         try:
-            response = self.get_response()
+            response = self.get_response(xe_params)
         except Exception:
             raise ConversionError(type='xe_error')
 
-        if self.check_response(response) is not False:
-            return response['converted']
+        if self.check_response(response, xe_params) is not False:
+            self.rate_cache[pair] = (response['converted'], time.time())
+            return params['amount'] * response['converted']
         else:
             self.vprint('Given input and/or output currency is not supported '
                         'by XE method and is skipped: '
@@ -157,20 +281,19 @@ class ConverterXE(ConverterCommon):
                         .format(params['in_currency'], params['out_currency']))
             raise ConversionError(type='unsupported')
 
-    def get_response(self):
+    def get_response(self, xe_params):
         """Get response from the server and return the conversion."""
-        response = requests.get(self.url_convert, params=self.params).content
-        bs = BeautifulSoup(response, "lxml")
-        converted = bs.find('span', class_='uccResultAmount').text.replace(',', '')
+        response = self.session.get(self.url_convert, params=xe_params).content
+        converted = RE_AMOUNT.search(response).group(1).replace(b',', b'')
         converted = float(converted)
         returned_currs = [
-            bs.find('span', class_='uccFromResultAmount').text[-5:-2],
-            bs.find('span', class_='uccToCurrencyCode').text
+            RE_FROM_CURR.search(response).group(1).decode(),
+            RE_TO_CURR.search(response).group(1).decode()
             ]
         return {'converted': converted,
                 'returned_currs': returned_currs}
 
-    def check_response(self, response):
+    def check_response(self, response, xe_params):
         """Check if the response from XE is as expected.
 
         The XE server checks if given currency codes are valid and if
@@ -179,8 +302,8 @@ class ConverterXE(ConverterCommon):
         Check if the response from XE contains such a replacement
         and if it does, consider the conversion unsuccessful.
         """
-        if (response['returned_currs'][0] != self.params['From'])\
-                or (response['returned_currs'][1] != self.params['To']):
+        if (response['returned_currs'][0] != xe_params['From'])\
+                or (response['returned_currs'][1] != xe_params['To']):
             return False
 
 
@@ -193,6 +316,7 @@ class ConverterOER(ConverterCommon):
         self.app_id = config['app_id']
         self.rates_exp = float(config['rates_expiration']) * 60
         self.rates = None
+        self.rates_timestamp = 0
 
     def convert(self, params):
         """Execute the conversion with given parameters.
@@ -200,36 +324,76 @@ class ConverterOER(ConverterCommon):
         The conversion is calculated locally using exchange rates
         from the OER API.
 
-        The free plan of OER API doesn't allow exchange rates for
-        currencies other than USD. If the conversion is to be made
-        for USD, it can be done directly. However, if USD is neither
-        input nor output currency, the function is run in two steps,
-        calling itself recursively to finish the conversion.
+        The free plan of OER API only provides exchange rates with
+        USD as the base currency, so the amount is converted through
+        USD in a single step: amount * rate_out / rate_in, where the
+        rate of USD itself is 1.
         """
-        if self.rates is None:
+        if self.rates_expired():
             self.load_rates()
 
-        try:
-            if params['in_currency'] == 'USD':
-                result = params['amount'] * self.rates[params['out_currency']]
-            elif params['out_currency'] == 'USD':
-                result = params['amount'] / self.rates[params['in_currency']]
-            else:
-                result = self.convert(
-                    {'amount': params['amount'] / self.rates[params['in_currency']],
-                     'in_currency': 'USD',
-                     'out_currency': params['out_currency']})
-        except KeyError as error:
-            self.vprint('Given currency is not supported by OER method and is skipped:'
-                        f' {error.args[0]}')
+        rates = self.rates
+        rate_in = self.lookup_rate(rates, params['in_currency'])
+        rate_out = self.lookup_rate(rates, params['out_currency'])
+        if rate_in is None or rate_out is None:
+            raise ConversionError(type='unsupported')
+
+        return params['amount'] * rate_out / rate_in
+
+    def convert_many(self, amount, in_currency, out_currencies):
+        """Convert an amount to multiple output currencies at once.
+
+        Every conversion reduces to amount * rate_out / rate_in, so the
+        values for all the output currencies are calculated in a single
+        vectorized operation. Output currencies not supported by OER
+        are skipped. Return a dictionary of the converted values.
+
+        The rates are read once, so that all the values are calculated
+        from the same rates even if another thread reloads them.
+        """
+        if self.rates_expired():
+            self.load_rates()
+
+        rates = self.rates
+        in_rate = self.lookup_rate(rates, in_currency)
+        if in_rate is None:
             raise ConversionError(type='unsupported')
 
-        return result
+        out_rates = {curr: self.lookup_rate(rates, curr) for curr in out_currencies}
+        codes = [curr for curr, rate in out_rates.items() if rate is not None]
+        values = np.fromiter((out_rates[curr] for curr in codes),
+                             dtype=np.float64, count=len(codes))
+        results = amount * values / in_rate
+        return dict(zip(codes, results.tolist()))
+
+    def lookup_rate(self, rates, currency):
+        """Return the exchange rate of a currency against USD.
+
+        The rate of USD itself is 1, even if it is missing in the rates.
+        Return None for a currency not supported by OER.
+        """
+        if currency == 'USD':
+            return 1.0
+
+        rate = rates.get(currency)
+        if rate is None:
+            self.vprint('Given currency is not supported by OER method and is skipped:'
+                        f' {currency}')
+        return rate
+
+    def rates_expired(self):
+        """Return True if the rates are not loaded or are outdated."""
+        return (self.rates is None
+                or time.time() - self.rates_timestamp > self.rates_exp)
 
     def load_rates(self):
         """Load exchange rates from cache or from remote server.
 
-        Firstly, check if rates cache is available and not corrupted.
+        Firstly, check if rates loaded by another converter with the
+        same app_id are held in memory and not expired. If so, use
+        them without touching the local cache.
+
+        Then check if rates cache is available and not corrupted.
         Then test if it is not older than the expiration time. If
         successful, use the rates from local cache.
 
@@ -237,9 +401,14 @@ class ConverterOER(ConverterCommon):
         from the OER API and save them to the cache. If the get
         request fails, raise an error handled by the main app.
         """
+        cached = RATES_CACHE.get(self.app_id)
+        if cached is not None and time.time() - cached[0] <= self.rates_exp:
+            self.rates_timestamp, self.rates = cached
+            return
+
         try:
-            with open(f'{self.filepath}/cache_rates.json', 'r') as f:
-                cache = json.load(f)
+            path = f'{self.filepath}/cache_rates.json'
+            cache = read_cache(path, os.path.getmtime(path))
             time_diff = time.time() - cache['timestamp']
             if time_diff > self.rates_exp:
                 raise ExpiredError
@@ -249,25 +418,43 @@ class ConverterOER(ConverterCommon):
             self.vprint('Exchange rates cache is outdated.')
         else:
             self.rates = cache['rates']
+            self.rates_timestamp = cache['timestamp']
+            RATES_CACHE[self.app_id] = (self.rates_timestamp, self.rates)
             self.vprint('Using exchange rates from cache.')
             return
 
         try:
             self.vprint(f'Requesting exchange rates from {self.url_rates}')
-            response = requests.get(self.url_rates,
-                                    params={'app_id': self.app_id}).json()
+            response = self.get_rates()
         except Exception:
             raise ConversionError(type='oer_error')
         else:
             self.vprint('Saving exchange rates to cache.')
             self.rates = response['rates']
+            self.rates_timestamp = response['timestamp']
+            RATES_CACHE[self.app_id] = (self.rates_timestamp, self.rates)
             self.save_rates(response)
 
+    def get_rates(self):
+        """Get exchange rates data from the OER API.
+
+        The response is parsed while it is streamed and only the rates
+        and their timestamp are kept, instead of buffering the whole
+        response body before parsing it.
+        """
+        with self.session.get(self.url_rates, params={'app_id': self.app_id},
+                              stream=True) as response:
+            response.raw.decode_content = True
+            data = dict()
+            for key, value in ijson.kvitems(response.raw, '', use_float=True):
+                if key in ('timestamp', 'rates'):
+                    data[key] = value
+        return {'timestamp': data['timestamp'], 'rates': data['rates']}
+
     def save_rates(self, response):
         """Save exchange rates data to the local cache."""
-        with open(f'{self.filepath}/cache_rates.json', 'w') as f:
-            cache = {
-                'timestamp': response['timestamp'],
-                'rates': response['rates']
-            }
-            f.write(json.dumps(cache))
+        cache = {
+            'timestamp': response['timestamp'],
+            'rates': response['rates']
+        }
+        write_cache(f'{self.filepath}/cache_rates.json', jsonlib.dumpb(cache))
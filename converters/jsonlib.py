@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+
+"""JSON (de)serialization used for the config and cache files.
+
+Uses the fast orjson library when it is installed and falls back
+to the standard json module otherwise. Both raise a subclass of
+json.decoder.JSONDecodeError on invalid input.
+"""
+
+try:
+    import orjson
+except ModuleNotFoundError:
+    orjson = None
+    import json
+
+
+if orjson is not None:
+    loads = orjson.loads
+    dumpb = orjson.dumps
+
+    def loadb(buffer):
+        """Deserialize JSON from a buffer, e.g. mmap, without copying it."""
+        with memoryview(buffer) as view:
+            return orjson.loads(view)
+else:
+    loads = json.loads
+
+    def dumpb(obj):
+        """Serialize an object to JSON formatted UTF-8 bytes."""
+        return json.dumps(obj).encode()
+
+    def loadb(buffer):
+        """Deserialize JSON from a buffer, e.g. mmap."""
+        return json.loads(bytes(buffer))
@@ -1,86 +1,33 @@
 #!/usr/bin/python3
 
 try:
+    import os
     import time
+    import functools
     import json
-    import argparse
-    from converters import ConverterXE, ConverterOER, ConversionError
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from converters import ConverterXE, ConverterOER, ConversionError, jsonlib
 except ModuleNotFoundError:
     print('Required modules could not be imported. '
           'Please install packages by running: "pip install -r requirements.txt"')
     exit(1)
 
+# Maximum number of concurrent requests sent to the XE server.
+XE_MAX_WORKERS = 16
 
-class ArgParser(argparse.ArgumentParser):
-    """Class for validating and parsing of command line arguments."""
-    def __init__(self):
-        super().__init__()
-        self.add_argument('--amount', '-a',
-                          help='amount to convert: <number>')
-        self.add_argument('--input_currency', '-i',
-                          help='currency to convert from: <currency code or symbol>')
-        self.add_argument('--output_currency', '-o',
-                          help='currency to convert to: <currency code or symbol>')
-        self.add_argument('--converter', '-c',
-                          help='override the conversion method: <"xe" or "oer">')
-        self.add_argument('--currencies', action='store_true',
-                          help='print a list of currencies, no conversion is done')
+# Converter objects reused across calls of main(), e.g. by the web app.
+CONVERTER_CACHE = dict()
 
-    def parse(self):
-        """Validate command line arguments and parse them for further use.
 
-        ArgParser reflects the two ways to use the application from CLI.
+@functools.lru_cache(maxsize=1)
+def read_config(mtime):
+    """Read and parse the config file.
 
-        If the program is run with the "currencies" option, other parameters
-        are ignored and the function returns True for "list_currs" option.
-
-        If "currencies" option is not used, "amount" and "input_currency"
-        parameters become required. If any of them is missing or if "amount"
-        is not a number, the program quits with a reference to the README.
-
-        Options and required parameters are parsed and returned as a list.
-        """
-        args = self.parse_args()
-
-        # Check if the "--currencies" option is used.
-        # If so, skip parsing of other args, since they are not used.
-        list_currs = args.currencies
-        if list_currs:
-            return [None, '', list_currs]
-
-        # Validate and parse remaining CLI args.
-        params = dict()
-
-        if args.amount:
-            try:
-                params['amount'] = float(args.amount)
-            except ValueError:
-                print('Given "--amount" argument is not a valid number. '
-                      'Refer to README to see the usage.')
-                exit(1)
-        else:
-            print('Missing "--amount" argument. '
-                  'Refer to README to see the usage.')
-            exit(1)
-
-        if args.input_currency:
-            params['in_currency'] = args.input_currency.upper()
-        else:
-            print('Missing "--input_currency" argument. '
-                  'Refer to README to see the usage.')
-            exit(1)
-
-        try:
-            params['out_currency'] = args.output_currency.upper()
-        except AttributeError:
-            params['out_currency'] = None
-
-        try:
-            override_converter = args.converter.lower()
-        except AttributeError:
-            override_converter = ''
-
-        return [params, override_converter, list_currs]
+    The parsed config is kept in memory and reused until the
+    modification time of the file changes.
+    """
+    with open('config.json', 'r') as f:
+        return jsonlib.loads(f.read())
 
 
 class App:
@@ -101,8 +48,7 @@ class App:
 
     def load_config(self):
         """Load configuration from a file."""
-        with open('config.json', 'r') as f:
-            return json.load(f)
+        return read_config(os.path.getmtime('config.json'))
 
     def set_converter(self, override_converter):
         """Set the conversion method and return a converter object.
@@ -111,22 +57,37 @@ class App:
         an optional overriding argument or the config file, whereas
         the overriding argument has a priority. The converter object
         is created with settings from the config file.
+
+        Converter objects are reused by subsequent App objects with
+        the same settings, only their expired data are reloaded.
         """
         if 'xe' in override_converter:
-            return ConverterXE(self.config['verbosity'],
-                               self.config['currencies_expiration'])
+            converter_class = ConverterXE
         elif 'oer' in override_converter:
-            return ConverterOER(self.config['oer_config'],
-                                self.config['verbosity'],
-                                self.config['currencies_expiration'])
+            converter_class = ConverterOER
+        elif self.config['converter'] == 'ConverterXE':
+            converter_class = ConverterXE
         else:
-            if self.config['converter'] == 'ConverterXE':
-                return ConverterXE(self.config['verbosity'],
-                                   self.config['currencies_expiration'])
-            else:
-                return ConverterOER(self.config['oer_config'],
-                                    self.config['verbosity'],
+            converter_class = ConverterOER
+
+        key = (converter_class.__name__,
+               self.config['verbosity'],
+               self.config['currencies_expiration'],
+               tuple(self.config['oer_config'].items()))
+        converter = CONVERTER_CACHE.get(key)
+        if converter is not None:
+            converter.refresh()
+            return converter
+
+        if converter_class is ConverterXE:
+            converter = ConverterXE(self.config['verbosity'],
                                     self.config['currencies_expiration'])
+        else:
+            converter = ConverterOER(self.config['oer_config'],
+                                     self.config['verbosity'],
+                                     self.config['currencies_expiration'])
+        CONVERTER_CACHE[key] = converter
+        return converter
 
     def check_currency(self, string, which):
         """Check if a given string is a valid currency code or symbol.
@@ -134,18 +95,21 @@ class App:
         Argument "which" determines if the tested currency is input or
         output. If it is the input currency and it fails the test,
         an error is raised that is handled in function main().
+
+        The string is expected to be already normalized to upper case
+        by the CLI or web API, it is not normalized again here.
         """
         if string is None:
             return None
 
         # Check if the string is a valid code.
-        if string in self.converter.currencies:
+        if string in self.converter.currency_codes:
             return string
 
         # Check if the string is a valid symbol and convert it to a code.
-        for code, values in self.converter.currencies.items():
-            if "'symbol': '{}'".format(string) in str(values):
-                return code
+        code = self.converter.symbol_to_code.get(string)
+        if code is not None:
+            return code
 
         # The string is invalid.
         if which == 'out':
@@ -204,10 +168,12 @@ class App:
         whether all known currencies should be used or there is
         an overriding list.
 
-        Then loop over all the chosen output currencies and
-        convert them. If an ConversionError occurs, it might be
-        caused by an unsupported currency, in which case continue
-        with the loop.
+        Then convert the amount to all the chosen output currencies,
+        at once for the OER method, which calculates them from the
+        exchange rates, or concurrently for the XE method, which
+        requests every conversion from its server. If an ConversionError
+        occurs, it might be caused by an unsupported currency, in which
+        case the currency is skipped.
 
         If there is another type of ConversionError, caused e.g.
         by lack of internet connection or the external service
@@ -219,29 +185,65 @@ class App:
             self.out_currs = [self.out_currs]
         else:
             if self.config['override_currencies'] is False:
-                self.out_currs = self.converter.currencies
+                self.out_currs = self.converter.currency_codes_tuple
             else:
                 self.out_currs = self.config['override_currencies']
 
+        targets = [curr for curr in self.out_currs
+                   if curr != self.params['in_currency']]
+        if isinstance(self.converter, ConverterOER):
+            try:
+                results = self.converter.convert_many(
+                    self.params['amount'], self.params['in_currency'], targets)
+            except ConversionError as error:
+                if error.type == 'unsupported':
+                    results = dict()
+                else:
+                    raise
+        else:
+            results = self.convert_concurrently(targets)
+
         converted = dict()
         for curr in self.out_currs:
             if curr == self.params['in_currency']:
                 converted[curr] = self.params['amount']
-            else:
+            elif curr in results:
+                converted[curr] = round(results[curr], 2)
+        return converted
+
+    def convert_concurrently(self, currencies):
+        """Convert the amount to the given currencies in parallel.
+
+        Every XE conversion is a blocking HTTP request, so the requests
+        are sent from a pool of threads and collected as they complete.
+        Unsupported currencies are skipped. On any other error, cancel
+        the conversions not started yet and re-raise the error.
+        """
+        results = dict()
+        with ThreadPoolExecutor(max_workers=XE_MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(self.converter.convert, self.get_params(curr)): curr
+                for curr in currencies
+            }
+            for future in as_completed(futures):
                 try:
-                    converted[curr] = self.converter.convert({
-                        'amount': self.params['amount'],
-                        'in_currency': self.params['in_currency'],
-                        'out_currency': curr
-                    })
+                    results[futures[future]] = future.result()
                 except ConversionError as error:
                     if error.type == 'unsupported':
                         continue
                     else:
+                        for pending in futures:
+                            pending.cancel()
                         raise
-                else:
-                    converted[curr] = round(converted[curr], 2)
-        return converted
+        return results
+
+    def get_params(self, out_currency):
+        """Return the converter parameters for a given output currency."""
+        return {
+            'amount': self.params['amount'],
+            'in_currency': self.params['in_currency'],
+            'out_currency': out_currency
+        }
 
     def vprint(self, *a, **k):
         """Print detailed information if verbosity is enabled."""
@@ -269,10 +271,12 @@ def main(CLI=True, params=None, override_converter='', list_currs=False,
     error occurs during the conversion, try one more time with the
     other conversion method by recursively calling function itself.
 
-    If running of the App is successful, print the output to the
-    console and return it to the caller (e.g. a web app).
+    If running of the App is successful, return the output to the
+    caller (e.g. a web app). When run from the CLI, also print the
+    output to the console, serialized to json for a conversion.
     """
     if CLI:
+        from cli import ArgParser
         parser = ArgParser()
         params, override_converter, list_currs = parser.parse()
 
@@ -297,16 +301,18 @@ def main(CLI=True, params=None, override_converter='', list_currs=False,
             return [2, 'Conversion failed.']
         if error.type == 'xe_error':
             print('ERROR: XE conversion method failed. Retrying with OER method.\n')
-            output = main(CLI=False, params=params, override_converter='oer',
-                          first_try=False)
-        if error.type == 'oer_error':
+            fallback_converter = 'oer'
+        else:
             print('ERROR: OER conversion method failed. Retrying with XE method.\n')
-            output = main(CLI=False, params=params, override_converter='xe',
-                          first_try=False)
-    else:
-        if not list_currs:
-            output = json.dumps(output, indent=4)
-        print(output)
+            fallback_converter = 'xe'
+        status, output = main(CLI=False, params=params,
+                              override_converter=fallback_converter,
+                              list_currs=list_currs, first_try=False)
+        if status != 0:
+            return [status, output]
+
+    if CLI:
+        print(output if list_currs else json.dumps(output, indent=4))
 
     return [0, output]
 
@@ -1,12 +1,12 @@
 #!/usr/bin/python3
 
 try:
-    import json
     from flask import Flask, request, redirect, url_for, render_template
     from flask_wtf import Form
     from wtforms import StringField, DecimalField
     from wtforms.validators import DataRequired
     import currency_converter
+    from converters import jsonlib
 except ModuleNotFoundError:
     print('Required modules could not be imported. '
           'Please install packages by running: "pip install -r requirements.txt"')
@@ -52,15 +52,12 @@ def convert():
     except ValueError:
         return 'Request Error: Given amount is not a valid number.', 400
 
-    try:
-        params['in_currency'] = request.args.get('input_currency').upper()
-    except AttributeError:
+    # Currencies are normalized here once, an empty value counts as missing.
+    in_currency = request.args.get('input_currency')
+    if not in_currency:
         return 'Request Error: Missing required argument: "input_currency".', 400
-
-    try:
-        params['out_currency'] = request.args.get('output_currency').upper()
-    except AttributeError:
-        params['out_currency'] = None
+    params['in_currency'] = in_currency.upper()
+    params['out_currency'] = request.args.get('output_currency', '').upper() or None
 
     try:
         override_converter = request.args.get('converter').lower()
@@ -71,7 +68,8 @@ def convert():
         CLI=False, params=params, override_converter=override_converter)
 
     if output[0] == 0:
-        return output[1], 200, {'Content-Type': 'application/json; charset=utf-8'}
+        return (jsonlib.dumpb(output[1]), 200,
+                {'Content-Type': 'application/json; charset=utf-8'})
     elif output[0] == 1:
         message = 'Request Error: ' + output[1]
         return message, 400
@@ -113,13 +111,13 @@ def convert_form():
         if form.validate():
             params['amount'] = float(request.form['amount'])
             params['in_currency'] = request.form['in_currency'].upper()
-            params['out_currency'] = request.form['out_currency'].upper()
+            params['out_currency'] = request.form['out_currency'].upper() or None
 
             output = currency_converter.main(
                 CLI=False, params=params, override_converter='')
 
             if output[0] == 0:
-                converted = json.loads(output[1])
+                converted = output[1]
                 return render_template('converter.html',
                                        form=form, converted=converted)
             else:
@@ -134,4 +132,4 @@ def convert_form():
 
 
 if __name__ == '__main__':
-    app.run(debug=False, host='0.0.0.0', port=5000)
+    app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)